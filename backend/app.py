@@ -3,27 +3,53 @@ Phishing Guard - Backend API Server v2.0
 Industry-Ready Flask application with enhanced security features
 """
 
-from flask import Flask, request, jsonify, g
+from flask import Flask, request, jsonify, g, abort
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from functools import wraps
 import logging
+import threading
+import weakref
 from datetime import datetime
 import os
+import orjson
+from cachetools import TTLCache
 
 # Import modules
-from detector import scan_url, scan_content
-from threat_intel import check_url, check_domain, analyze_content, add_whitelist, add_blacklist, get_lists
+from detector import scan_url, scan_content, RISK_LEVEL_TABLE
+from threat_intel import (check_url, check_domain, analyze_content, add_whitelist, add_blacklist, get_lists,
+                          extract_hostname)
 import models
 
 # Configure logging
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+
+class ORJSONProvider(JSONProvider):
+    """JSON provider backed by orjson (C implementation) for request/response bodies"""
+    
+    mimetype = 'application/json'
+    option = orjson.OPT_NON_STR_KEYS
+    
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, option=self.option).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Write the encoded bytes directly instead of round-tripping through str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, option=self.option), mimetype=self.mimetype)
+
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'phishing-guard-secret-key-change-in-production')
 
 # Enable CORS for Chrome extension and dashboard
@@ -37,18 +63,106 @@ CORS(app, resources={
     }
 })
 
-# Global statistics (in-memory, for quick access)
-stats = {
-    'total_scans': 0,
-    'threats_detected': 0,
-    'start_time': datetime.now().isoformat()
-}
+
+# ============================================
+# GLOBAL STATISTICS
+# ============================================
+
+class _ThreadToken:
+    """Marker kept in a thread's local storage; it is collected when the thread exits"""
+
+
+class ScanCounters:
+    """
+    In-memory scan counters kept per thread and summed on read.
+    Each thread only writes its own buffer, so recording a scan takes no lock.
+    A thread's buffer is folded into the retired totals when the thread exits.
+    """
+    
+    def __init__(self):
+        self._local = threading.local()
+        self._buffers = {}  # id(buffer) -> [scans, threats] for live threads
+        self._retired = [0, 0]  # counts from threads that have exited
+        self._lock = threading.Lock()
+    
+    def add(self, scanned: int, threats: int):
+        """Record scans made by the current thread"""
+        buf = getattr(self._local, 'buf', None)
+        if buf is None:
+            buf = self._local.buf = [0, 0]
+            token = self._local.token = _ThreadToken()
+            with self._lock:
+                self._buffers[id(buf)] = buf
+            weakref.finalize(token, self._retire, id(buf))
+        buf[0] += scanned
+        buf[1] += threats
+    
+    def _retire(self, key: int):
+        """Fold an exited thread's buffer into the retired totals"""
+        with self._lock:
+            buf = self._buffers.pop(key)
+            self._retired[0] += buf[0]
+            self._retired[1] += buf[1]
+    
+    def totals(self) -> tuple:
+        """Return (total_scans, threats_detected) across all threads"""
+        with self._lock:
+            scans, threats = self._retired
+            for buf in self._buffers.values():
+                scans += buf[0]
+                threats += buf[1]
+        return scans, threats
+
+
+scan_counters = ScanCounters()
+START_TIME = datetime.now().isoformat()
+
+
+def request_timestamp() -> str:
+    """ISO timestamp for the current request, computed at most once per request"""
+    if 'request_time' not in g:
+        g.request_time = datetime.now().isoformat()
+    return g.request_time
+
+
+def parse_json_body() -> dict:
+    """
+    Parse the request body with orjson, skipping Flask's content-type checks.
+    Aborts with 400 when the body is empty, not valid JSON or not an object.
+    """
+    try:
+        data = orjson.loads(request.get_data(cache=False) or b'null')
+    except orjson.JSONDecodeError:
+        abort(400, description='Invalid JSON body')
+    if not isinstance(data, dict):
+        abort(400, description='Request body must be a JSON object')
+    return data
+
+
+MAX_BATCH_SIZE = 50
 
 
 # ============================================
 # AUTHENTICATION MIDDLEWARE
 # ============================================
 
+# Recently authenticated API keys, so repeat requests skip the users table lookup
+api_key_cache = TTLCache(maxsize=1024, ttl=60)
+api_key_cache_lock = threading.Lock()
+
+
+def lookup_api_key(api_key: str):
+    """Resolve an API key to its user, caching successful lookups"""
+    with api_key_cache_lock:
+        user = api_key_cache.get(api_key)
+    if user is None:
+        user = models.get_user_by_api_key(api_key)
+        if user:
+            with api_key_cache_lock:
+                api_key_cache[api_key] = user
+    return user
+
+
 def require_api_key(f):
     """Decorator to require API key for protected endpoints"""
     @wraps(f)
@@ -57,7 +171,7 @@ def require_api_key(f):
         if not api_key:
             return jsonify({'error': 'API key required'}), 401
         
-        user = models.get_user_by_api_key(api_key)
+        user = lookup_api_key(api_key)
         if not user:
             return jsonify({'error': 'Invalid API key'}), 401
         
@@ -72,8 +186,7 @@ def optional_api_key(f):
     def decorated(*args, **kwargs):
         api_key = request.headers.get('X-API-Key')
         if api_key:
-            user = models.get_user_by_api_key(api_key)
-            g.user = user
+            g.user = lookup_api_key(api_key)
         else:
             g.user = None
         return f(*args, **kwargs)
@@ -84,32 +197,39 @@ def optional_api_key(f):
 # HEALTH & INFO ENDPOINTS
 # ============================================
 
+# Nothing in the health payload changes after boot, so it is encoded once
+HEALTH_RESPONSE_BODY = orjson.dumps({
+    'status': 'healthy',
+    'service': 'Phishing Guard API',
+    'version': '2.0.0',
+    'uptime_since': START_TIME,
+    'features': [
+        'phishing_detection',
+        'threat_intelligence',
+        'password_protection',
+        'user_settings_sync',
+        'whitelist_blacklist'
+    ]
+})
+
+# Only the two counters vary between stats responses
+STATS_RESPONSE_TEMPLATE = (
+    b'{"total_scans":%d,"threats_detected":%d,"uptime_since":' + orjson.dumps(START_TIME) + b'}'
+)
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'service': 'Phishing Guard API',
-        'version': '2.0.0',
-        'uptime_since': stats['start_time'],
-        'features': [
-            'phishing_detection',
-            'threat_intelligence',
-            'password_protection',
-            'user_settings_sync',
-            'whitelist_blacklist'
-        ]
-    })
+    return app.response_class(HEALTH_RESPONSE_BODY, mimetype='application/json')
 
 
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """Get global scanning statistics"""
-    return jsonify({
-        'total_scans': stats['total_scans'],
-        'threats_detected': stats['threats_detected'],
-        'uptime_since': stats['start_time']
-    })
+    total_scans, threats_detected = scan_counters.totals()
+    return app.response_class(STATS_RESPONSE_TEMPLATE % (total_scans, threats_detected),
+                              mimetype='application/json')
 
 
 # ============================================
@@ -119,8 +239,8 @@ def get_stats():
 @app.route('/api/auth/register', methods=['POST'])
 def register():
     """Register new user"""
+    data = parse_json_body()
     try:
-        data = request.get_json()
         email = data.get('email')
         password = data.get('password')
         
@@ -134,7 +254,7 @@ def register():
         if not user:
             return jsonify({'error': 'Email already registered'}), 409
         
-        logger.info(f"New user registered: {email}")
+        logger.info("New user registered: %s", email)
         
         return jsonify({
             'success': True,
@@ -146,15 +266,15 @@ def register():
         }), 201
         
     except Exception as e:
-        logger.error(f"Registration error: {e}")
+        logger.error("Registration error: %s", e)
         return jsonify({'error': 'Registration failed'}), 500
 
 
 @app.route('/api/auth/login', methods=['POST'])
 def login():
     """Authenticate user"""
+    data = parse_json_body()
     try:
-        data = request.get_json()
         email = data.get('email')
         password = data.get('password')
         
@@ -165,7 +285,7 @@ def login():
         if not user:
             return jsonify({'error': 'Invalid credentials'}), 401
         
-        logger.info(f"User logged in: {email}")
+        logger.info("User logged in: %s", email)
         
         return jsonify({
             'success': True,
@@ -177,7 +297,7 @@ def login():
         })
         
     except Exception as e:
-        logger.error(f"Login error: {e}")
+        logger.error("Login error: %s", e)
         return jsonify({'error': 'Login failed'}), 500
 
 
@@ -212,8 +332,8 @@ def get_settings():
 @require_api_key
 def update_settings():
     """Update user settings"""
+    data = parse_json_body()
     try:
-        data = request.get_json()
         success = models.update_user_settings(g.user['id'], data)
         
         if success:
@@ -225,7 +345,7 @@ def update_settings():
             return jsonify({'error': 'Failed to update settings'}), 500
             
     except Exception as e:
-        logger.error(f"Settings update error: {e}")
+        logger.error("Settings update error: %s", e)
         return jsonify({'error': 'Update failed'}), 500
 
 
@@ -240,19 +360,15 @@ def scan_endpoint():
     Main scanning endpoint with enhanced detection
     Accepts: { "url": "https://example.com", "content": {...} }
     """
+    data = parse_json_body()
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({'error': 'No data provided'}), 400
-        
         url = data.get('url')
         content = data.get('content', {})
         
         if not url:
             return jsonify({'error': 'URL is required'}), 400
         
-        logger.info(f"Scanning URL: {url}")
+        logger.info("Scanning URL: %s", url)
         
         # Perform URL analysis
         url_result = scan_url(url)
@@ -261,34 +377,23 @@ def scan_endpoint():
         threat_result = check_url(url)
         
         # Merge threat intelligence results
+        score = url_result['risk_score']
         if threat_result.get('risk_factors'):
             url_result['warnings'].extend(threat_result['risk_factors'])
-        
-        if threat_result.get('reputation_score', 100) < 60:
-            url_result['risk_score'] = min(100, url_result['risk_score'] + (60 - threat_result['reputation_score']))
+        score += max(0, 60 - threat_result.get('reputation_score', 100))
         
         # Perform content analysis if provided
-        content_result = {}
         if content:
             content_result = scan_content(content)
-            url_result['risk_score'] = min(100, 
-                url_result['risk_score'] + content_result.get('risk_score', 0))
+            score += content_result.get('risk_score', 0)
             url_result['warnings'].extend(content_result.get('content_risks', []))
         
-        # Recalculate risk level
-        if url_result['risk_score'] >= 70:
-            url_result['risk_level'] = 'dangerous'
-            url_result['is_phishing'] = True
-        elif url_result['risk_score'] >= 50:
-            url_result['risk_level'] = 'suspicious'
-            url_result['is_phishing'] = True
-        elif url_result['risk_score'] >= 30:
-            url_result['risk_level'] = 'warning'
+        # Recalculate risk level (all deltas are non-negative, so clamp once)
+        url_result['risk_score'] = min(100, score)
+        url_result['risk_level'], url_result['is_phishing'] = RISK_LEVEL_TABLE[url_result['risk_score']]
         
         # Update statistics
-        stats['total_scans'] += 1
-        if url_result['is_phishing']:
-            stats['threats_detected'] += 1
+        scan_counters.add(1, 1 if url_result['is_phishing'] else 0)
         
         # Record scan for authenticated users
         if g.user:
@@ -309,15 +414,15 @@ def scan_endpoint():
                     'threat_types': threat_result.get('threat_types', [])
                 }
             },
-            'timestamp': datetime.now().isoformat()
+            'timestamp': request_timestamp()
         }
         
-        logger.info(f"Scan complete - Risk: {url_result['risk_level']} ({url_result['risk_score']})")
+        logger.info("Scan complete - Risk: %s (%d)", url_result['risk_level'], url_result['risk_score'])
         
         return jsonify(response)
     
     except Exception as e:
-        logger.error(f"Scan error: {str(e)}")
+        logger.error("Scan error: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -328,15 +433,14 @@ def scan_endpoint():
 @optional_api_key
 def verify_site():
     """Deep site verification endpoint"""
+    data = parse_json_body()
     try:
-        data = request.get_json()
         url = data.get('url')
         
         if not url:
             return jsonify({'error': 'URL is required'}), 400
         
-        from urllib.parse import urlparse
-        domain = urlparse(url).netloc
+        domain = extract_hostname(url)
         
         # Get comprehensive threat intelligence
         reputation = check_domain(domain)
@@ -356,7 +460,7 @@ def verify_site():
         })
         
     except Exception as e:
-        logger.error(f"Verification error: {e}")
+        logger.error("Verification error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -364,8 +468,8 @@ def verify_site():
 @optional_api_key
 def analyze_content_endpoint():
     """Analyze page content for threats"""
+    data = parse_json_body()
     try:
-        data = request.get_json()
         content = data.get('content', '')
         
         result = analyze_content(content)
@@ -376,7 +480,7 @@ def analyze_content_endpoint():
         })
         
     except Exception as e:
-        logger.error(f"Content analysis error: {e}")
+        logger.error("Content analysis error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -384,28 +488,22 @@ def analyze_content_endpoint():
 @optional_api_key
 def batch_scan_endpoint():
     """Batch scanning endpoint for multiple URLs"""
+    data = parse_json_body()
     try:
-        data = request.get_json()
         urls = data.get('urls', [])
         
         if not urls or not isinstance(urls, list):
             return jsonify({'error': 'URLs array is required'}), 400
         
-        if len(urls) > 50:
-            return jsonify({'error': 'Maximum 50 URLs per batch'}), 400
-        
-        results = []
-        for url in urls:
-            result = scan_url(url)
-            results.append({
-                'url': url,
-                'is_phishing': result['is_phishing'],
-                'risk_score': result['risk_score'],
-                'risk_level': result['risk_level']
-            })
-            stats['total_scans'] += 1
-            if result['is_phishing']:
-                stats['threats_detected'] += 1
+        if len(urls) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'Maximum {MAX_BATCH_SIZE} URLs per batch'}), 400
+        
+        results = [scan_url(url, light=True) for url in urls]
+        
+        # Update statistics once for the whole batch
+        threats = sum(1 for r in results if r['is_phishing'])
+        scan_counters.add(len(results), threats)
+        logger.info("Batch scan: %d urls, %d threats", len(results), threats)
         
         return jsonify({
             'success': True,
@@ -414,7 +512,7 @@ def batch_scan_endpoint():
         })
     
     except Exception as e:
-        logger.error(f"Batch scan error: {str(e)}")
+        logger.error("Batch scan error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
@@ -437,8 +535,8 @@ def get_whitelist():
 @require_api_key
 def add_to_whitelist_endpoint():
     """Add domain to whitelist"""
+    data = parse_json_body()
     try:
-        data = request.get_json()
         domain = data.get('domain')
         notes = data.get('notes', '')
         
@@ -483,8 +581,8 @@ def get_blacklist():
 @require_api_key
 def add_to_blacklist_endpoint():
     """Add domain to blacklist"""
+    data = parse_json_body()
     try:
-        data = request.get_json()
         domain = data.get('domain')
         reason = data.get('reason', '')
         
@@ -550,21 +648,20 @@ def get_user_stats():
 @optional_api_key
 def report_phishing():
     """Report a phishing URL"""
+    data = parse_json_body()
     try:
-        data = request.get_json()
         url = data.get('url')
         reason = data.get('reason', '')
         
         if not url:
             return jsonify({'error': 'URL is required'}), 400
         
-        from urllib.parse import urlparse
-        domain = urlparse(url).netloc
+        domain = extract_hostname(url)
         
         # Add to global threat database
         add_blacklist(domain)
         
-        logger.info(f"Phishing report received: {url}")
+        logger.info("Phishing report received: %s", url)
         
         return jsonify({
             'success': True,
@@ -579,6 +676,11 @@ def report_phishing():
 # ERROR HANDLERS
 # ============================================
 
+@app.errorhandler(400)
+def bad_request(error):
+    return jsonify({'error': error.description}), 400
+
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({'error': 'Endpoint not found'}), 404
@@ -619,4 +721,9 @@ if __name__ == '__main__':
     logger.info("  GET      /api/stats/user- User statistics")
     logger.info("=" * 50)
     
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    if os.environ.get('FLASK_DEBUG') == '1':
+        # Werkzeug dev server with reloader/debugger, for local development only
+        app.run(host='0.0.0.0', port=5000, debug=True)
+    else:
+        from waitress import serve
+        serve(app, host='0.0.0.0', port=5000, threads=32)
@@ -4,27 +4,58 @@ Analyzes URLs and page content to detect potential phishing attempts
 """
 
 import re
-import socket
+from functools import lru_cache
 from urllib.parse import urlparse
 import tldextract
-import requests
+
+# Domain splitter shared by all scans. Uses the public suffix list bundled
+# with tldextract rather than fetching it over the network on first use.
+tld_extract = tldextract.TLDExtract(suffix_list_urls=())
 
 # Known phishing indicators and suspicious patterns
-SUSPICIOUS_KEYWORDS = [
+# (a tuple, not a set: matches are reported in this order)
+SUSPICIOUS_KEYWORDS = (
     'login', 'signin', 'sign-in', 'log-in', 'verify', 'verification',
     'update', 'confirm', 'account', 'secure', 'security', 'banking',
     'password', 'credential', 'authenticate', 'wallet', 'paypal',
     'amazon', 'apple', 'microsoft', 'google', 'facebook', 'netflix',
     'instagram', 'twitter', 'linkedin', 'dropbox', 'icloud'
-]
+)
+
+# Top-level domains, without the leading dot
+SUSPICIOUS_TLDS = frozenset([
+    'tk', 'ml', 'ga', 'cf', 'gq', 'xyz', 'top', 'pw',
+    'cc', 'su', 'ru', 'cn', 'work', 'click', 'link'
+])
+
+# Literal suspicious patterns, matched case-insensitively as substrings
+SUSPICIOUS_SUBSTRINGS = (
+    '@',  # @ symbol in URL (credential attack)
+    '--',  # Multiple dashes
+    '..',  # Multiple dots
+    'xn--',  # Punycode (IDN homograph attacks)
+)
+
+# Host that starts with a dotted IPv4 address
+IP_ADDRESS_PATTERN = re.compile(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}')
 
-SUSPICIOUS_TLDS = [
-    '.tk', '.ml', '.ga', '.cf', '.gq', '.xyz', '.top', '.pw',
-    '.cc', '.su', '.ru', '.cn', '.work', '.click', '.link'
-]
+# Keywords that are suspicious when repeated in one URL (e.g. secure-login.../verify)
+REPEATED_KEYWORD_PATTERN = re.compile(r'secure|login|account|verify|update', re.IGNORECASE)
+
+# Brand names with digits swapped in for letters (typosquatting);
+# matched against the lowercased netloc
+TYPOSQUAT_PATTERN = re.compile(r'g[0o]{2}gle|amaz[0o]n|paypa[l1i]|faceb[0o]{2}k|netf[l1]ix|micr[0o]s[0o]ft')
+TYPOSQUAT_REAL_DOMAINS = (
+    'google.com', 'amazon.com', 'paypal.com', 'facebook.com', 'netflix.com', 'microsoft.com'
+)
+
+# Known URL shortener domains
+SHORTENERS = frozenset([
+    'bit.ly', 'tinyurl.com', 't.co', 'goo.gl', 'ow.ly', 'is.gd'
+])
 
 # Known legitimate domains (whitelist) - expanded list
-TRUSTED_DOMAINS = [
+TRUSTED_DOMAINS = frozenset([
     # Google services
     'google.com', 'gmail.com', 'youtube.com', 'googleapis.com', 
     'googleusercontent.com', 'gstatic.com', 'google.co.in', 'google.co.uk',
@@ -68,7 +99,23 @@ TRUSTED_DOMAINS = [
     # Other trusted
     'twitch.tv', 'steampowered.com', 'epicgames.com',
     'adobe.com', 'autodesk.com', 'grammarly.com'
-]
+])
+
+# (risk_level, is_phishing) for every clamped risk score 0-100
+RISK_LEVEL_TABLE = (
+    (('safe', False),) * 30 +
+    (('warning', False),) * 20 +
+    (('suspicious', True),) * 20 +
+    (('dangerous', True),) * 31
+)
+
+# Number of analyzed URLs kept in memory for repeat scans
+URL_CACHE_SIZE = 4096
+# Longer URLs are analyzed uncached, so client-chosen keys can't pin large strings
+MAX_CACHED_URL_LENGTH = 2048
+
+# Fields kept by light scans (batch results)
+LIGHT_RESULT_FIELDS = ('url', 'is_phishing', 'risk_score', 'risk_level')
 
 
 class PhishingDetector:
@@ -76,25 +123,77 @@ class PhishingDetector:
     
     def __init__(self):
         self.suspicious_patterns = self._compile_patterns()
+        self._trusted_trie = self._build_domain_trie(TRUSTED_DOMAINS)
+        # analyze_url() depends only on the URL string, so repeat scans are served from here
+        self._analyze_url_cached = lru_cache(maxsize=URL_CACHE_SIZE)(self._analyze_url)
+    
+    @staticmethod
+    def _build_domain_trie(domains) -> dict:
+        """
+        Build a trie of domain labels from the TLD inward,
+        e.g. 'mail.google.com' -> {'com': {'google': {'mail': {None: True}}}}
+        """
+        trie = {}
+        for domain in domains:
+            node = trie
+            for label in reversed(domain.split('.')):
+                node = node.setdefault(label, {})
+            node[None] = True  # a listed domain ends here
+        return trie
+    
+    def _is_trusted_host(self, hostname: str) -> bool:
+        """Check if hostname is a trusted domain or a subdomain of one"""
+        node = self._trusted_trie
+        for label in reversed(hostname.split('.')):
+            node = node.get(label)
+            if node is None:
+                return False
+            if None in node:
+                return True
+        return False
     
     def _compile_patterns(self):
         """Compile regex patterns for suspicious URL detection"""
+        # Literal patterns are checked as plain substrings, see SUSPICIOUS_SUBSTRINGS;
+        # repeated keywords are checked by _has_repeated_keyword()
         patterns = [
             r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}',  # IP address in URL
-            r'@',  # @ symbol in URL (credential attack)
-            r'-{2,}',  # Multiple dashes
-            r'\.{2,}',  # Multiple dots
-            r'[0-9]+[a-z]+[0-9]+',  # Mixed numbers and letters
-            r'(secure|login|account|verify|update).+(secure|login|account|verify|update)',  # Repeated keywords
-            r'xn--',  # Punycode (IDN homograph attacks)
+            r'[0-9][a-z]+[0-9]',  # Mixed numbers and letters
         ]
         return [re.compile(p, re.IGNORECASE) for p in patterns]
     
+    @staticmethod
+    def _has_repeated_keyword(url: str) -> bool:
+        """
+        Linear-time equivalent of (kw).+(kw): a second keyword starting at least one
+        character after the first ends, with no newline in between
+        """
+        first = REPEATED_KEYWORD_PATTERN.search(url)
+        while first:
+            second = REPEATED_KEYWORD_PATTERN.search(url, first.end() + 1)
+            if second is None:
+                return False
+            if '\n' not in url[first.end():second.start()]:
+                return True
+            first = second
+        return False
+    
     def analyze_url(self, url: str) -> dict:
         """
         Analyze a URL for phishing indicators
-        Returns a detailed analysis with risk score
+        Returns a detailed analysis with risk score (a fresh copy, safe to modify)
         """
+        result = self.shared_analysis(url)
+        return dict(result, warnings=list(result['warnings']), details=dict(result['details']))
+    
+    def shared_analysis(self, url: str) -> dict:
+        """Cached analyze_url() result; callers must not modify it"""
+        if not isinstance(url, str) or len(url) > MAX_CACHED_URL_LENGTH:
+            return self._analyze_url(url)
+        return self._analyze_url_cached(url)
+    
+    def _analyze_url(self, url: str) -> dict:
+        """Uncached URL analysis"""
         result = {
             'url': url,
             'is_phishing': False,
@@ -104,14 +203,17 @@ class PhishingDetector:
             'details': {}
         }
         
+        score = 0  # written to result['risk_score'] once, after clamping
+        
         try:
             parsed = urlparse(url)
-            extracted = tldextract.extract(url)
+            extracted = tld_extract(url)
+            host = parsed.netloc.lower()
             
             # Check if URL is valid
-            if not parsed.scheme or not parsed.netloc:
+            if not parsed.scheme or not host:
                 result['warnings'].append('Invalid URL format')
-                result['risk_score'] += 30
+                score += 30
             
             # === URL Structure Analysis ===
             result['details']['domain'] = extracted.registered_domain
@@ -122,103 +224,83 @@ class PhishingDetector:
             # Check for HTTPS
             if parsed.scheme != 'https':
                 result['warnings'].append('No HTTPS encryption')
-                result['risk_score'] += 15
+                score += 15
             
-            # Check domain against trusted list (improved matching)
-            hostname = parsed.netloc.lower()
-            is_trusted = False
-            
-            # Check exact match with registered domain
-            if extracted.registered_domain in TRUSTED_DOMAINS:
-                is_trusted = True
-            
-            # Check if hostname ends with a trusted domain (for subdomains)
-            if not is_trusted:
-                for trusted in TRUSTED_DOMAINS:
-                    if hostname == trusted or hostname.endswith('.' + trusted):
-                        is_trusted = True
-                        break
+            # Check domain against trusted list (exact match or subdomain).
+            # fqdn is the host without userinfo, port or trailing dot.
+            is_trusted = self._is_trusted_host(extracted.fqdn.lower())
             
+            result['details']['trusted_domain'] = is_trusted
             if is_trusted:
-                result['risk_score'] = max(0, result['risk_score'] - 50)  # Stronger trust bonus
-                result['details']['trusted_domain'] = True
-            else:
-                result['details']['trusted_domain'] = False
+                score = max(0, score - 50)  # Stronger trust bonus
             
             # === Suspicious Pattern Detection ===
             
             # Check for IP address in URL
-            if re.match(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}', parsed.netloc):
+            if IP_ADDRESS_PATTERN.match(host):
                 result['warnings'].append('IP address used instead of domain')
-                result['risk_score'] += 40
+                score += 40
             
-            # Check for suspicious TLD
-            for tld in SUSPICIOUS_TLDS:
-                if url.endswith(tld) or tld in extracted.suffix:
-                    result['warnings'].append(f'Suspicious TLD: {tld}')
-                    result['risk_score'] += 25
-                    break
+            # Check for suspicious TLD (last label of the public suffix, e.g. 'cn' in 'com.cn')
+            tld = extracted.suffix.rpartition('.')[2].lower()
+            if tld in SUSPICIOUS_TLDS:
+                result['warnings'].append(f'Suspicious TLD: .{tld}')
+                score += 25
             
             # Check for suspicious keywords in domain
-            domain_full = parsed.netloc.lower()
             matched_keywords = []
             for keyword in SUSPICIOUS_KEYWORDS:
-                if keyword in domain_full:
+                if keyword in host:
                     matched_keywords.append(keyword)
             
-            if matched_keywords and not result['details'].get('trusted_domain'):
+            if matched_keywords and not is_trusted:
                 result['warnings'].append(f'Suspicious keywords in domain: {", ".join(matched_keywords)}')
-                result['risk_score'] += len(matched_keywords) * 8
+                score += len(matched_keywords) * 8
             
             # Check URL length (phishing URLs tend to be long)
             if len(url) > 100:
                 result['warnings'].append('Unusually long URL')
-                result['risk_score'] += 10
+                score += 10
             
             # Check for excessive subdomains
-            subdomain_count = len(extracted.subdomain.split('.')) if extracted.subdomain else 0
+            subdomain_count = extracted.subdomain.count('.') + 1 if extracted.subdomain else 0
             if subdomain_count > 3:
                 result['warnings'].append(f'Excessive subdomains ({subdomain_count})')
-                result['risk_score'] += 15
+                score += 15
             
             # Check for @ symbol (credential harvesting attempt)
             if '@' in url:
                 result['warnings'].append('URL contains @ symbol (potential credential attack)')
-                result['risk_score'] += 35
+                score += 35
             
             # Check for suspicious patterns
             for pattern in self.suspicious_patterns:
                 if pattern.search(url):
-                    result['risk_score'] += 5
+                    score += 5
+            if self._has_repeated_keyword(url):
+                score += 5
+            url_lower = url.lower()
+            for substring in SUSPICIOUS_SUBSTRINGS:
+                if substring in url_lower:
+                    score += 5
             
             # Check for mixed content (numbers replacing letters) - only if NOT trusted
-            if not result['details'].get('trusted_domain'):
-                if re.search(r'g[0o]{2}gle|amaz[0o]n|paypa[l1i]|faceb[0o]{2}k|netf[l1]ix|micr[0o]s[0o]ft', domain_full, re.IGNORECASE):
+            if not is_trusted:
+                if TYPOSQUAT_PATTERN.search(host):
                     # Make sure it's not the real domain
-                    real_domains = ['google.com', 'amazon.com', 'paypal.com', 'facebook.com', 'netflix.com', 'microsoft.com']
-                    if not any(rd in domain_full for rd in real_domains):
+                    if not any(rd in host for rd in TYPOSQUAT_REAL_DOMAINS):
                         result['warnings'].append('Possible typosquatting detected')
-                        result['risk_score'] += 45
+                        score += 45
             
             # Check for URL shorteners
-            shorteners = ['bit.ly', 'tinyurl.com', 't.co', 'goo.gl', 'ow.ly', 'is.gd']
-            if any(s in domain_full for s in shorteners):
+            if extracted.registered_domain in SHORTENERS:
                 result['warnings'].append('URL shortener detected (destination unknown)')
-                result['risk_score'] += 20
+                score += 20
             
             # === Determine Risk Level ===
-            result['risk_score'] = min(100, max(0, result['risk_score']))
-            
-            if result['risk_score'] >= 70:
-                result['risk_level'] = 'dangerous'
-                result['is_phishing'] = True
-            elif result['risk_score'] >= 50:
-                result['risk_level'] = 'suspicious'
-                result['is_phishing'] = True
-            elif result['risk_score'] >= 30:
-                result['risk_level'] = 'warning'
-            else:
-                result['risk_level'] = 'safe'
+            score = min(100, max(0, score))
+            result['risk_score'] = score
+            result['risk_level'], result['is_phishing'] = RISK_LEVEL_TABLE[score]
             
         except Exception as e:
             result['warnings'].append(f'Analysis error: {str(e)}')
@@ -273,11 +355,18 @@ class PhishingDetector:
 detector = PhishingDetector()
 
 
-def scan_url(url: str) -> dict:
-    """Public function to scan a URL"""
+def scan_url(url: str, light: bool = False) -> dict:
+    """Public function to scan a URL (light=True returns only the verdict fields)"""
+    if light:
+        return light_result(detector.shared_analysis(url))
     return detector.analyze_url(url)
 
 
+def light_result(result: dict) -> dict:
+    """Reduce a full URL analysis to the verdict fields, without warnings/details"""
+    return {field: result[field] for field in LIGHT_RESULT_FIELDS}
+
+
 def scan_content(content: dict) -> dict:
     """Public function to scan page content"""
     return detector.analyze_page_content(content)
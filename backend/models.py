@@ -6,153 +6,230 @@ SQLite-based storage for user settings, scan history, and threat data
 import sqlite3
 import json
 import os
+import threading
+import atexit
+import queue
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
 import hashlib
+import hmac
 import secrets
 
 # Database path
 DB_PATH = os.path.join(os.path.dirname(__file__), 'phishing_guard.db')
 
 
+# Per-connection tuning; journal_mode=WAL is persistent and set in init_database()
+CONNECTION_PRAGMAS = (
+    'PRAGMA synchronous=NORMAL',  # safe with WAL, no fsync per commit
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=134217728',  # 128 MB
+    'PRAGMA cache_size=-20000',  # ~20 MB page cache
+)
+
+
+# One connection per thread, reused across calls
+_thread_local = threading.local()
+_open_connections = {}  # thread -> connection, so they can be closed later
+_open_connections_lock = threading.Lock()
+
+
 def get_db_connection():
-    """Get database connection with row factory"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    """Get this thread's database connection (opened on first use)"""
+    conn = getattr(_thread_local, 'conn', None)
+    if conn is None:
+        # check_same_thread=False only so close_db_connections() can close it
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        _thread_local.conn = conn
+        with _open_connections_lock:
+            # Close connections left behind by finished threads. The main thread
+            # reports not alive while atexit handlers still run on it, so keep its.
+            main = threading.main_thread()
+            for thread in [t for t in _open_connections if t is not main and not t.is_alive()]:
+                _open_connections.pop(thread).close()
+            _open_connections[threading.current_thread()] = conn
     return conn
 
 
+def release_db_connection(conn):
+    """Hand the connection back after use, discarding any uncommitted work"""
+    if conn.in_transaction:
+        conn.rollback()
+
+
+@atexit.register
+def close_db_connections():
+    """Close pooled connections on shutdown, except those of threads still running"""
+    current = threading.current_thread()
+    with _open_connections_lock:
+        for thread in list(_open_connections):
+            if thread is current or not thread.is_alive():
+                _open_connections.pop(thread).close()
+
+
 def init_database():
     """Initialize database tables"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            api_key TEXT UNIQUE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_login TIMESTAMP
-        )
-    ''')
-    
-    # User settings table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_settings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER UNIQUE,
-            protection_level TEXT DEFAULT 'medium',
-            phishing_protection BOOLEAN DEFAULT 1,
-            password_guard BOOLEAN DEFAULT 1,
-            payment_protection BOOLEAN DEFAULT 1,
-            link_scanner BOOLEAN DEFAULT 1,
-            real_time_alerts BOOLEAN DEFAULT 1,
-            auto_block_dangerous BOOLEAN DEFAULT 1,
-            notification_sound BOOLEAN DEFAULT 0,
-            dark_mode BOOLEAN DEFAULT 1,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
-    
-    # Whitelist table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS whitelist (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            domain TEXT NOT NULL,
-            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            notes TEXT,
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            UNIQUE(user_id, domain)
-        )
-    ''')
-    
-    # Blacklist table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS blacklist (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            domain TEXT NOT NULL,
-            reason TEXT,
-            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            UNIQUE(user_id, domain)
-        )
-    ''')
-    
-    # Scan history table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS scan_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            url TEXT NOT NULL,
-            domain TEXT,
-            risk_score INTEGER,
-            risk_level TEXT,
-            is_phishing BOOLEAN,
-            threats_detected TEXT,
-            scanned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
-    
-    # Global threat database
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS threat_database (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            domain TEXT UNIQUE NOT NULL,
-            threat_type TEXT,
-            severity TEXT,
-            reported_count INTEGER DEFAULT 1,
-            first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            verified BOOLEAN DEFAULT 0
-        )
-    ''')
-    
-    # Statistics table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS statistics (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            date DATE,
-            scans_count INTEGER DEFAULT 0,
-            threats_blocked INTEGER DEFAULT 0,
-            phishing_detected INTEGER DEFAULT 0,
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            UNIQUE(user_id, date)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    try:
+        cursor = conn.cursor()
+        
+        # Write-ahead logging: readers don't block on writers
+        cursor.execute('PRAGMA journal_mode=WAL')
+        
+        # Users table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                email TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                api_key TEXT UNIQUE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_login TIMESTAMP
+            )
+        ''')
+        
+        # User settings table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_settings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER UNIQUE,
+                protection_level TEXT DEFAULT 'medium',
+                phishing_protection BOOLEAN DEFAULT 1,
+                password_guard BOOLEAN DEFAULT 1,
+                payment_protection BOOLEAN DEFAULT 1,
+                link_scanner BOOLEAN DEFAULT 1,
+                real_time_alerts BOOLEAN DEFAULT 1,
+                auto_block_dangerous BOOLEAN DEFAULT 1,
+                notification_sound BOOLEAN DEFAULT 0,
+                dark_mode BOOLEAN DEFAULT 1,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        ''')
+        
+        # Whitelist table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS whitelist (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                domain TEXT NOT NULL,
+                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                notes TEXT,
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                UNIQUE(user_id, domain)
+            )
+        ''')
+        
+        # Blacklist table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS blacklist (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                domain TEXT NOT NULL,
+                reason TEXT,
+                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                UNIQUE(user_id, domain)
+            )
+        ''')
+        
+        # Scan history table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scan_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                url TEXT NOT NULL,
+                domain TEXT,
+                risk_score INTEGER,
+                risk_level TEXT,
+                is_phishing BOOLEAN,
+                threats_detected TEXT,
+                scanned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        ''')
+        
+        # Global threat database
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS threat_database (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                domain TEXT UNIQUE NOT NULL,
+                threat_type TEXT,
+                severity TEXT,
+                reported_count INTEGER DEFAULT 1,
+                first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                verified BOOLEAN DEFAULT 0
+            )
+        ''')
+        
+        # Statistics table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS statistics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                date DATE,
+                scans_count INTEGER DEFAULT 0,
+                threats_blocked INTEGER DEFAULT 0,
+                phishing_detected INTEGER DEFAULT 0,
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                UNIQUE(user_id, date)
+            )
+        ''')
+        
+        # History is read newest-first per user. statistics, whitelist and blacklist
+        # are already covered by the indexes behind their UNIQUE(user_id, ...) constraints.
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_scan_history_user_time
+            ON scan_history(user_id, scanned_at DESC)
+        ''')
+        
+        conn.commit()
+    finally:
+        release_db_connection(conn)
 
 
 # ============================================
 # USER MANAGEMENT
 # ============================================
 
+# scrypt cost parameters (16 MB of memory per hash)
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+
 def hash_password(password: str) -> str:
-    """Hash password with salt"""
-    salt = secrets.token_hex(16)
-    hash_obj = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), 100000)
-    return f"{salt}:{hash_obj.hex()}"
+    """Hash password with salt (scrypt$n$r$p$salt$hash)"""
+    salt = secrets.token_bytes(16)
+    hash_obj = hashlib.scrypt(password.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, dklen=32)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${hash_obj.hex()}"
 
 
 def verify_password(password: str, password_hash: str) -> bool:
-    """Verify password against hash"""
+    """Verify password against hash (scrypt, or legacy pbkdf2 salt:hash)"""
     try:
-        salt, hash_hex = password_hash.split(':')
-        hash_obj = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), 100000)
-        return hash_obj.hex() == hash_hex
+        if password_hash.startswith('scrypt$'):
+            _, n, r, p, salt, hash_hex = password_hash.split('$')
+            hash_obj = hashlib.scrypt(password.encode(), salt=bytes.fromhex(salt),
+                                      n=int(n), r=int(r), p=int(p), dklen=len(hash_hex) // 2)
+        else:
+            salt, hash_hex = password_hash.split(':')
+            hash_obj = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), 100000)
+        return hmac.compare_digest(hash_obj.hex(), hash_hex)
     except:
         return False
 
 
+def password_needs_rehash(password_hash: str) -> bool:
+    """Check if a stored hash predates the current scheme or cost"""
+    return not password_hash.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+
+
 def create_user(email: str, password: str) -> Optional[Dict]:
     """Create new user"""
     conn = get_db_connection()
@@ -184,43 +261,52 @@ def create_user(email: str, password: str) -> Optional[Dict]:
     except sqlite3.IntegrityError:
         return None
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 
 def authenticate_user(email: str, password: str) -> Optional[Dict]:
     """Authenticate user and return user data"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM users WHERE email = ?', (email.lower(),))
-    user = cursor.fetchone()
-    
-    if user and verify_password(password, user['password_hash']):
+    try:
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT * FROM users WHERE email = ?', (email.lower(),))
+        user = cursor.fetchone()
+        
+        if not user or not verify_password(password, user['password_hash']):
+            return None
+        
         # Update last login
         cursor.execute('''
             UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?
         ''', (user['id'],))
-        conn.commit()
-        conn.close()
         
-        return {
-            'id': user['id'],
-            'email': user['email'],
-            'api_key': user['api_key']
-        }
+        # Upgrade legacy hashes now that we have the plaintext
+        if password_needs_rehash(user['password_hash']):
+            cursor.execute('''
+                UPDATE users SET password_hash = ? WHERE id = ?
+            ''', (hash_password(password), user['id']))
+        conn.commit()
+    finally:
+        release_db_connection(conn)
     
-    conn.close()
-    return None
+    return {
+        'id': user['id'],
+        'email': user['email'],
+        'api_key': user['api_key']
+    }
 
 
 def get_user_by_api_key(api_key: str) -> Optional[Dict]:
     """Get user by API key"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM users WHERE api_key = ?', (api_key,))
-    user = cursor.fetchone()
-    conn.close()
+    try:
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT * FROM users WHERE api_key = ?', (api_key,))
+        user = cursor.fetchone()
+    finally:
+        release_db_connection(conn)
     
     if user:
         return {
@@ -238,11 +324,13 @@ def get_user_by_api_key(api_key: str) -> Optional[Dict]:
 def get_user_settings(user_id: int) -> Dict:
     """Get user settings"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM user_settings WHERE user_id = ?', (user_id,))
-    settings = cursor.fetchone()
-    conn.close()
+    try:
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT * FROM user_settings WHERE user_id = ?', (user_id,))
+        settings = cursor.fetchone()
+    finally:
+        release_db_connection(conn)
     
     if settings:
         return {
@@ -323,7 +411,7 @@ def update_user_settings(user_id: int, settings: Dict) -> bool:
         print(f"Error updating settings: {e}")
         return False
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 
 # ============================================
@@ -333,15 +421,17 @@ def update_user_settings(user_id: int, settings: Dict) -> bool:
 def get_whitelist(user_id: int = None) -> List[Dict]:
     """Get whitelist for user or global"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    if user_id:
-        cursor.execute('SELECT * FROM whitelist WHERE user_id = ? ORDER BY added_at DESC', (user_id,))
-    else:
-        cursor.execute('SELECT * FROM whitelist ORDER BY added_at DESC')
-    
-    items = cursor.fetchall()
-    conn.close()
+    try:
+        cursor = conn.cursor()
+        
+        if user_id:
+            cursor.execute('SELECT * FROM whitelist WHERE user_id = ? ORDER BY added_at DESC', (user_id,))
+        else:
+            cursor.execute('SELECT * FROM whitelist ORDER BY added_at DESC')
+        
+        items = cursor.fetchall()
+    finally:
+        release_db_connection(conn)
     
     return [{'domain': item['domain'], 'added_at': item['added_at'], 'notes': item['notes']} for item in items]
 
@@ -366,32 +456,36 @@ def add_to_whitelist(user_id: int, domain: str, notes: str = None) -> bool:
     except:
         return False
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 
 def remove_from_whitelist(user_id: int, domain: str) -> bool:
     """Remove domain from whitelist"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('DELETE FROM whitelist WHERE user_id = ? AND domain = ?', (user_id, domain.lower()))
-    conn.commit()
-    conn.close()
+    try:
+        cursor = conn.cursor()
+        
+        cursor.execute('DELETE FROM whitelist WHERE user_id = ? AND domain = ?', (user_id, domain.lower()))
+        conn.commit()
+    finally:
+        release_db_connection(conn)
     return True
 
 
 def get_blacklist(user_id: int = None) -> List[Dict]:
     """Get blacklist for user or global"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    if user_id:
-        cursor.execute('SELECT * FROM blacklist WHERE user_id = ? ORDER BY added_at DESC', (user_id,))
-    else:
-        cursor.execute('SELECT * FROM blacklist ORDER BY added_at DESC')
-    
-    items = cursor.fetchall()
-    conn.close()
+    try:
+        cursor = conn.cursor()
+        
+        if user_id:
+            cursor.execute('SELECT * FROM blacklist WHERE user_id = ? ORDER BY added_at DESC', (user_id,))
+        else:
+            cursor.execute('SELECT * FROM blacklist ORDER BY added_at DESC')
+        
+        items = cursor.fetchall()
+    finally:
+        release_db_connection(conn)
     
     return [{'domain': item['domain'], 'added_at': item['added_at'], 'reason': item['reason']} for item in items]
 
@@ -416,17 +510,19 @@ def add_to_blacklist(user_id: int, domain: str, reason: str = None) -> bool:
     except:
         return False
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 
 def remove_from_blacklist(user_id: int, domain: str) -> bool:
     """Remove domain from blacklist"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('DELETE FROM blacklist WHERE user_id = ? AND domain = ?', (user_id, domain.lower()))
-    conn.commit()
-    conn.close()
+    try:
+        cursor = conn.cursor()
+        
+        cursor.execute('DELETE FROM blacklist WHERE user_id = ? AND domain = ?', (user_id, domain.lower()))
+        conn.commit()
+    finally:
+        release_db_connection(conn)
     return True
 
 
@@ -434,107 +530,188 @@ def remove_from_blacklist(user_id: int, domain: str) -> bool:
 # SCAN HISTORY & STATISTICS
 # ============================================
 
+# Scan records are written in batches by a background thread, off the request path
+_scan_record_queue = queue.Queue()
+SCAN_RECORD_BATCH_SIZE = 64
+SCAN_RECORD_FLUSH_INTERVAL = 0.1  # seconds
+SCAN_RECORD_WRITER_JOIN_TIMEOUT = 10  # seconds to let the writer finish its batch at exit
+_scan_record_writer_stop = threading.Event()
+
+# Warnings are stored in threats_detected joined by the ASCII unit separator
+THREAT_SEPARATOR = '\x1f'
+
+SQL_INSERT_SCAN = '''
+    INSERT INTO scan_history (user_id, url, domain, risk_score, risk_level, is_phishing, threats_detected)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+SQL_UPSERT_STATISTICS = '''
+    INSERT INTO statistics (user_id, date, scans_count, threats_blocked, phishing_detected)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, date) DO UPDATE SET
+        scans_count = scans_count + excluded.scans_count,
+        threats_blocked = threats_blocked + excluded.threats_blocked,
+        phishing_detected = phishing_detected + excluded.phishing_detected
+'''
+
+
 def add_scan_record(user_id: int, url: str, result: Dict) -> bool:
-    """Add scan to history"""
+    """Queue a scan for the history writer (returns immediately)"""
+    _scan_record_queue.put((user_id, url, result))
+    return True
+
+
+def add_scan_records_bulk(records: List[Tuple[int, str, Dict]]) -> bool:
+    """Add several (user_id, url, result) scans to history in one transaction"""
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
-        from urllib.parse import urlparse
-        domain = urlparse(url).netloc
+        history_rows = []
+        daily_counts = {}
+        for user_id, url, result in records:
+            is_phishing = 1 if result.get('is_phishing') else 0
+            history_rows.append((
+                user_id,
+                url,
+                result.get('details', {}).get('domain') or urlparse(url).netloc,
+                result.get('risk_score', 0),
+                result.get('risk_level', 'unknown'),
+                result.get('is_phishing', False),
+                THREAT_SEPARATOR.join(result.get('warnings', []))
+            ))
+            scans, phishing = daily_counts.get(user_id, (0, 0))
+            daily_counts[user_id] = (scans + 1, phishing + is_phishing)
         
-        cursor.execute('''
-            INSERT INTO scan_history (user_id, url, domain, risk_score, risk_level, is_phishing, threats_detected)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            user_id,
-            url,
-            domain,
-            result.get('risk_score', 0),
-            result.get('risk_level', 'unknown'),
-            result.get('is_phishing', False),
-            json.dumps(result.get('warnings', []))
-        ))
-        
-        # Update daily statistics
         today = datetime.now().date().isoformat()
-        cursor.execute('''
-            INSERT INTO statistics (user_id, date, scans_count, threats_blocked, phishing_detected)
-            VALUES (?, ?, 1, ?, ?)
-            ON CONFLICT(user_id, date) DO UPDATE SET
-                scans_count = scans_count + 1,
-                threats_blocked = threats_blocked + excluded.threats_blocked,
-                phishing_detected = phishing_detected + excluded.phishing_detected
-        ''', (
-            user_id,
-            today,
-            1 if result.get('is_phishing') else 0,
-            1 if result.get('is_phishing') else 0
-        ))
+        statistics_rows = [
+            (user_id, today, scans, phishing, phishing)
+            for user_id, (scans, phishing) in daily_counts.items()
+        ]
         
+        # Take the write lock up front rather than upgrading a deferred transaction
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.executemany(SQL_INSERT_SCAN, history_rows)
+        # Update daily statistics (one upsert per user)
+        cursor.executemany(SQL_UPSERT_STATISTICS, statistics_rows)
         conn.commit()
         return True
     except Exception as e:
-        print(f"Error adding scan record: {e}")
+        print(f"Error adding scan records: {e}")
         return False
     finally:
-        conn.close()
+        release_db_connection(conn)
+
+
+def flush_scan_records(wait: float = 0) -> int:
+    """Write up to one batch of queued scan records, waiting up to `wait` seconds for the first"""
+    batch = []
+    try:
+        batch.append(_scan_record_queue.get(timeout=wait) if wait else _scan_record_queue.get_nowait())
+        while len(batch) < SCAN_RECORD_BATCH_SIZE:
+            batch.append(_scan_record_queue.get_nowait())
+    except queue.Empty:
+        pass
+    
+    if batch:
+        add_scan_records_bulk(batch)
+    return len(batch)
+
+
+def _scan_record_writer():
+    """Background loop flushing queued scan records every SCAN_RECORD_FLUSH_INTERVAL until stopped"""
+    while not _scan_record_writer_stop.is_set():
+        if flush_scan_records(wait=SCAN_RECORD_FLUSH_INTERVAL) < SCAN_RECORD_BATCH_SIZE:
+            _scan_record_writer_stop.wait(SCAN_RECORD_FLUSH_INTERVAL)
+
+
+@atexit.register
+def flush_pending_scan_records():
+    """
+    Stop the writer, letting it finish the batch it holds, then write out anything
+    still queued (runs before connections close)
+    """
+    _scan_record_writer_stop.set()
+    _scan_record_writer_thread.join(timeout=SCAN_RECORD_WRITER_JOIN_TIMEOUT)
+    while flush_scan_records():
+        pass
+
+
+def parse_threats(threats_detected: Optional[str]) -> List[str]:
+    """Split a stored threats_detected value (rows written before the separator format hold JSON)"""
+    if not threats_detected:
+        return []
+    if threats_detected.startswith('['):
+        try:
+            threats = json.loads(threats_detected)
+        except ValueError:
+            threats = None  # a separator-format row whose first warning starts with '['
+        if isinstance(threats, list):
+            return threats
+    return threats_detected.split(THREAT_SEPARATOR)
 
 
 def get_scan_history(user_id: int, limit: int = 50) -> List[Dict]:
     """Get scan history for user"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT * FROM scan_history 
-        WHERE user_id = ? 
-        ORDER BY scanned_at DESC 
-        LIMIT ?
-    ''', (user_id, limit))
-    
-    items = cursor.fetchall()
-    conn.close()
+    try:
+        cursor = conn.cursor()
+        
+        # Plain tuples: rows are unpacked by position below
+        cursor.row_factory = None
+        cursor.execute('''
+            SELECT url, domain, risk_score, risk_level, is_phishing, threats_detected, scanned_at
+            FROM scan_history 
+            WHERE user_id = ? 
+            ORDER BY scanned_at DESC 
+            LIMIT ?
+        ''', (user_id, limit))
+        
+        items = cursor.fetchall()
+    finally:
+        release_db_connection(conn)
     
     return [{
-        'url': item['url'],
-        'domain': item['domain'],
-        'risk_score': item['risk_score'],
-        'risk_level': item['risk_level'],
-        'is_phishing': bool(item['is_phishing']),
-        'threats': json.loads(item['threats_detected']) if item['threats_detected'] else [],
-        'scanned_at': item['scanned_at']
-    } for item in items]
+        'url': url,
+        'domain': domain,
+        'risk_score': risk_score,
+        'risk_level': risk_level,
+        'is_phishing': bool(is_phishing),
+        'threats': parse_threats(threats_detected),
+        'scanned_at': scanned_at
+    } for url, domain, risk_score, risk_level, is_phishing, threats_detected, scanned_at in items]
 
 
 def get_user_statistics(user_id: int, days: int = 30) -> Dict:
     """Get user statistics for the past N days"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT 
-            SUM(scans_count) as total_scans,
-            SUM(threats_blocked) as total_threats,
-            SUM(phishing_detected) as total_phishing
-        FROM statistics 
-        WHERE user_id = ? 
-        AND date >= date('now', ?)
-    ''', (user_id, f'-{days} days'))
-    
-    totals = cursor.fetchone()
-    
-    # Daily breakdown
-    cursor.execute('''
-        SELECT date, scans_count, threats_blocked, phishing_detected
-        FROM statistics 
-        WHERE user_id = ? 
-        AND date >= date('now', ?)
-        ORDER BY date DESC
-    ''', (user_id, f'-{days} days'))
-    
-    daily = cursor.fetchall()
-    conn.close()
+    try:
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT 
+                SUM(scans_count) as total_scans,
+                SUM(threats_blocked) as total_threats,
+                SUM(phishing_detected) as total_phishing
+            FROM statistics 
+            WHERE user_id = ? 
+            AND date >= date('now', ?)
+        ''', (user_id, f'-{days} days'))
+        
+        totals = cursor.fetchone()
+        
+        # Daily breakdown
+        cursor.execute('''
+            SELECT date, scans_count, threats_blocked, phishing_detected
+            FROM statistics 
+            WHERE user_id = ? 
+            AND date >= date('now', ?)
+            ORDER BY date DESC
+        ''', (user_id, f'-{days} days'))
+        
+        daily = cursor.fetchall()
+    finally:
+        release_db_connection(conn)
     
     return {
         'totals': {
@@ -553,3 +730,5 @@ def get_user_statistics(user_id: int, days: int = 30) -> Dict:
 
 # Initialize database on module load
 init_database()
+_scan_record_writer_thread = threading.Thread(target=_scan_record_writer, name='scan-record-writer', daemon=True)
+_scan_record_writer_thread.start()
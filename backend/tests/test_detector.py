@@ -0,0 +1,34 @@
+"""Tests for URL pattern checks"""
+
+import random
+import re
+
+import pytest
+
+from detector import PhishingDetector
+
+# The regex _has_repeated_keyword replaced
+REPEATED_KEYWORD_REGEX = re.compile(
+    r'(secure|login|account|verify|update).+(secure|login|account|verify|update)', re.IGNORECASE)
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('https://secure-login.example.com/', True),
+    ('https://securelogin.example.com/', False),
+    ('https://example.com/login/verify', True),
+    ('https://example.com/account', False),
+    ('login\nverify', False),
+    ('LOGIN-x-VERIFY', True),
+])
+def test_has_repeated_keyword_examples(url, expected):
+    assert PhishingDetector._has_repeated_keyword(url) is expected
+
+
+def test_has_repeated_keyword_matches_regex():
+    pieces = ['secure', 'login', 'account', 'verify', 'update', 'LOGIN', 'Secure',
+              'x', '-', '/', '.', '\n', 'sec', 'logi', 'up']
+    rng = random.Random(3)
+    for _ in range(50000):
+        url = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 8)))
+        expected = bool(REPEATED_KEYWORD_REGEX.search(url))
+        assert PhishingDetector._has_repeated_keyword(url) is expected, repr(url)
@@ -0,0 +1,115 @@
+"""Tests for password hashing and stored scan history parsing"""
+
+import hashlib
+import secrets
+import threading
+
+import pytest
+
+import models
+
+
+def legacy_hash(password: str) -> str:
+    """Hash in the pbkdf2 salt:hash format used before scrypt"""
+    salt = secrets.token_hex(16)
+    hash_obj = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), 100000)
+    return f"{salt}:{hash_obj.hex()}"
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Point this thread's pooled connection at a fresh database"""
+    current = threading.current_thread()
+    original = models._open_connections.get(current)
+    monkeypatch.setattr(models, 'DB_PATH', str(tmp_path / 'phishing_guard.db'))
+    monkeypatch.setattr(models._thread_local, 'conn', None)
+    models.init_database()
+    yield
+    with models._open_connections_lock:
+        models._open_connections.pop(current).close()
+        if original is not None:
+            models._open_connections[current] = original
+
+
+def insert_user(email: str, password_hash: str):
+    conn = models.get_db_connection()
+    conn.execute('INSERT INTO users (email, password_hash, api_key) VALUES (?, ?, ?)',
+                 (email, password_hash, secrets.token_urlsafe(32)))
+    conn.commit()
+
+
+def stored_hash(email: str) -> str:
+    conn = models.get_db_connection()
+    return conn.execute('SELECT password_hash FROM users WHERE email = ?', (email,)).fetchone()[0]
+
+
+# ============================================
+# PASSWORD HASHING
+# ============================================
+
+def test_scrypt_hash_round_trip():
+    password_hash = models.hash_password('correct horse')
+    assert password_hash.startswith('scrypt$')
+    assert models.verify_password('correct horse', password_hash)
+    assert not models.verify_password('wrong horse', password_hash)
+    assert not models.password_needs_rehash(password_hash)
+
+
+def test_legacy_pbkdf2_hash_still_verifies():
+    password_hash = legacy_hash('correct horse')
+    assert models.verify_password('correct horse', password_hash)
+    assert not models.verify_password('wrong horse', password_hash)
+    assert models.password_needs_rehash(password_hash)
+
+
+def test_older_scrypt_cost_needs_rehash():
+    assert models.password_needs_rehash('scrypt$1024$8$1$00$00')
+
+
+def test_malformed_hash_does_not_verify():
+    assert not models.verify_password('anything', 'not-a-hash')
+    assert not models.verify_password('anything', 'scrypt$bad')
+
+
+def test_login_upgrades_legacy_hash(database):
+    insert_user('legacy@example.com', legacy_hash('correct horse'))
+    
+    user = models.authenticate_user('legacy@example.com', 'correct horse')
+    
+    assert user is not None and user['email'] == 'legacy@example.com'
+    upgraded = stored_hash('legacy@example.com')
+    assert upgraded.startswith(f"scrypt${models.SCRYPT_N}${models.SCRYPT_R}${models.SCRYPT_P}$")
+    assert models.verify_password('correct horse', upgraded)
+    assert models.authenticate_user('legacy@example.com', 'correct horse') is not None
+
+
+def test_wrong_password_never_rehashes(database):
+    original = legacy_hash('correct horse')
+    insert_user('legacy@example.com', original)
+    
+    assert models.authenticate_user('legacy@example.com', 'wrong horse') is None
+    assert stored_hash('legacy@example.com') == original
+
+
+def test_current_hash_is_not_rewritten_on_login(database):
+    models.create_user('new@example.com', 'correct horse')
+    original = stored_hash('new@example.com')
+    
+    assert models.authenticate_user('new@example.com', 'correct horse') is not None
+    assert stored_hash('new@example.com') == original
+
+
+# ============================================
+# SCAN HISTORY
+# ============================================
+
+@pytest.mark.parametrize('stored, expected', [
+    (None, []),
+    ('', []),
+    ('["Legacy warning", "Another"]', ['Legacy warning', 'Another']),
+    ('First\x1fSecond', ['First', 'Second']),
+    ('[Brand] lookalike\x1fSecond', ['[Brand] lookalike', 'Second']),
+    ('[unterminated', ['[unterminated']),
+])
+def test_parse_threats(stored, expected):
+    assert models.parse_threats(stored) == expected
@@ -0,0 +1,47 @@
+"""Tests for URL hostname extraction"""
+
+import random
+from urllib.parse import urlparse
+
+import pytest
+
+from threat_intel import MAX_CACHED_URL_LENGTH, _cached_hostname, extract_hostname
+
+
+def urlparse_hostname(url: str) -> str:
+    """Reference behaviour extract_hostname must match"""
+    try:
+        return urlparse(url).hostname or ''
+    except ValueError:
+        return ''
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('https://Login.Example.com:8443/path?q=1#f', 'login.example.com'),
+    ('http://user:pw@host.com/', 'host.com'),
+    ('http://a@b@evil.tk/', 'evil.tk'),
+    ('http://[::1]:8080/', '::1'),
+    ('http://[::1/', ''),
+    ('//cdn.example.com/x', 'cdn.example.com'),
+    ('example.com/path', ''),
+    ('', ''),
+])
+def test_extract_hostname_examples(url, expected):
+    assert extract_hostname(url) == expected
+
+
+def test_extract_hostname_matches_urlparse():
+    alphabet = 'aHhTtPpSs:/?#@[].-_ \t\n\r0123456789xyz\u00e9%\\+\x00\x1f'
+    prefixes = ['http://', 'https://', 'HTTP://', 'ftp://', 'http:/', '', 'http:///', '//',
+                ' http://', 'a+b://', '1a://', '//a@', 'x:']
+    rng = random.Random(7)
+    for _ in range(50000):
+        url = rng.choice(prefixes) + ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 20)))
+        assert extract_hostname(url) == urlparse_hostname(url), repr(url)
+
+
+def test_long_urls_bypass_the_cache():
+    _cached_hostname.cache_clear()
+    url = 'http://Example.com/' + 'a' * MAX_CACHED_URL_LENGTH
+    assert extract_hostname(url) == 'example.com'
+    assert _cached_hostname.cache_info().currsize == 0
@@ -5,33 +5,32 @@ Real-time threat intelligence, reputation scoring, and blocklist management
 
 import hashlib
 import time
-from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 import re
 import socket
 import ssl
-import requests
+import threading
+from functools import lru_cache
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from urllib.parse import urlparse
+from cachetools import TTLCache
+
+try:
+    import whois
+except ImportError:  # domain age checks are skipped without python-whois
+    whois = None
 
 # ============================================
 # THREAT INTELLIGENCE DATABASES
 # ============================================
 
-# Known phishing domains (expanded list)
-KNOWN_PHISHING_PATTERNS = [
-    r'.*-login.*\..*',
-    r'.*login-.*\..*',
-    r'.*secure-.*\..*',
-    r'.*-secure.*\..*',
-    r'.*verify-.*\..*',
-    r'.*-verify.*\..*',
-    r'.*update-.*\..*',
-    r'.*-update.*\..*',
-    r'.*account-.*\..*',
-    r'.*-account.*\..*',
-    r'.*signin-.*\..*',
-    r'.*-signin.*\..*',
-]
+# Known phishing domains: a keyword joined to another label by a dash
+# ('paypal-login.com', 'secure-bank.net'), followed somewhere by a dot
+KNOWN_PHISHING_TOKENS = ('login', 'secure', 'verify', 'update', 'account', 'signin')
+KNOWN_PHISHING_PATTERN = re.compile(
+    r'.*?(?:-(?:{0})|(?:{0})-).*\.'.format('|'.join(KNOWN_PHISHING_TOKENS)),
+    re.IGNORECASE
+)
 
 # Malicious script patterns
 MALICIOUS_SCRIPT_PATTERNS = {
@@ -97,14 +96,144 @@ EXFILTRATION_PATTERNS = [
 ]
 
 
+# Escaped characters in a pattern (an escaped backslash is consumed as a pair)
+PATTERN_ESCAPE = re.compile(r'\\(.)', re.DOTALL)
+
+
+def _compile_lowercase(patterns: List[str]) -> List[Tuple[str, re.Pattern]]:
+    """
+    Compile patterns for matching against lowercased content, as (source, compiled)
+    pairs; lowercasing the pattern replaces re.IGNORECASE
+    """
+    for p in patterns:
+        # Lowercasing would silently turn \S, \D, \W, \B, ... into different escapes
+        if any(escaped.isupper() for escaped in PATTERN_ESCAPE.findall(p)):
+            raise ValueError(f"Pattern {p!r} has an uppercase escape and cannot be lowercased")
+    return [(p, re.compile(p.lower())) for p in patterns]
+
+
+# Severity per script threat type, resolved once instead of per match
+HIGH_SEVERITY_SCRIPT_THREATS = ('keylogger', 'credential_stealer')
+SCRIPT_THREAT_SEVERITY = {
+    threat_type: 'high' if threat_type in HIGH_SEVERITY_SCRIPT_THREATS else 'medium'
+    for threat_type in MALICIOUS_SCRIPT_PATTERNS
+}
+
+# Content threat table, one row per reportable threat in report order. Scans
+# record matches as bits of an int (row n is bit 1 << n) and build
+# threats_detected and the score from these rows once at the end.
+CONTENT_THREAT_ENTRIES: List[Dict] = []
+CONTENT_THREAT_SCORES: List[int] = []
+
+
+def _register_threat(entry: Dict, score: int) -> int:
+    """Add a row to the content threat table and return its bit"""
+    CONTENT_THREAT_ENTRIES.append(entry)
+    CONTENT_THREAT_SCORES.append(score)
+    return 1 << (len(CONTENT_THREAT_ENTRIES) - 1)
+
+
+def _register_pattern_group(threat_type: str, patterns: List[str], severity: str,
+                            score: int) -> List[Tuple[int, re.Pattern]]:
+    """Compile a pattern group as (bit, compiled) pairs, one table row per pattern"""
+    return [
+        (_register_threat({'type': threat_type, 'pattern': source, 'severity': severity}, score), compiled)
+        for source, compiled in _compile_lowercase(patterns)
+    ]
+
+
+# Compiled once at import, registered in the order results are reported
+COMPILED_SCRIPT_PATTERNS = {
+    threat_type: _register_pattern_group(threat_type, patterns, SCRIPT_THREAT_SEVERITY[threat_type], 30)
+    for threat_type, patterns in MALICIOUS_SCRIPT_PATTERNS.items()
+}
+COMPILED_EXFILTRATION_PATTERNS = _register_pattern_group(
+    'data_exfiltration', EXFILTRATION_PATTERNS, 'critical', 40)
+COMPILED_FORM_PATTERNS = _register_pattern_group(
+    'suspicious_form', SUSPICIOUS_FORM_PATTERNS, 'high', 35)
+HIDDEN_CREDENTIAL_BIT = _register_threat({'type': 'hidden_credential_field', 'severity': 'critical'}, 50)
+FAKE_LOGIN_BIT = _register_threat({'type': 'fake_login_form', 'severity': 'high'}, 35)
+
+# Literal prescan: every pattern in the group contains one of these substrings,
+# so a page without any of them skips the group's regexes entirely
+SCRIPT_PATTERN_LITERALS = {
+    'keylogger': ('key',),
+    'obfuscation': ('eval', 'unescape'),
+}
+EXFILTRATION_LITERALS = ('password',)
+FORM_LITERALS = ('action=',)
+
+# Shared TLS client context; loading the CA bundle once instead of per handshake
+SSL_CONTEXT = ssl.create_default_context()
+
+# Fake login form indicators
+FAKE_LOGIN_BRANDS = ('google', 'facebook', 'apple', 'microsoft', 'amazon', 'paypal', 'netflix')
+URGENT_PHRASES = ('urgent', 'immediate', 'suspended', 'verify now', 'act now', 'limited time')
+
+HIDDEN_CREDENTIAL_PATTERN = re.compile(r'<input[^>]*type=["\']hidden["\'][^>]*name=["\'].*(?:pass|pwd|password)')
+# Any password input. A trailing [^>]*(?!autocomplete) used to follow; the
+# lookahead always held at the end of the tag, so it never excluded anything
+PASSWORD_FIELD_PATTERN = re.compile(r'<input[^>]*type=["\']password["\']')
+JAVASCRIPT_FORM_ACTION_PATTERN = re.compile(r'<form[^>]*action=["\']javascript:')
+
+# [scheme:]//[userinfo@]host[:port]... -> host
+HOSTNAME_PATTERN = re.compile(r'^(?:[a-zA-Z][a-zA-Z0-9+.-]*:)?//(?:[^/?#@]*@)?([^/?#:]*)')
+# URLs containing any of these (IPv6 literals and zone ids, characters urlsplit
+# strips) are handed to urlparse, as are URLs with several '@', non-ASCII text
+# or leading blanks
+URLPARSE_FALLBACK_CHARS = ('[', ']', '%', '\t', '\r', '\n')
+HOSTNAME_CACHE_SIZE = 4096
+# Longer URLs are parsed uncached, so client-chosen keys can't pin large strings
+MAX_CACHED_URL_LENGTH = 2048
+
+
+def extract_hostname(url: str) -> str:
+    """
+    Lowercased host of a URL without userinfo or port ('' if there is none),
+    as urlparse(url).hostname gives it; malformed IPv6 literals also give ''
+    """
+    if len(url) > MAX_CACHED_URL_LENGTH:
+        return _parse_hostname(url)
+    return _cached_hostname(url)
+
+
+def _parse_hostname(url: str) -> str:
+    """Uncached extract_hostname()"""
+    if (url[:1] <= ' ' or url.count('@') > 1 or not url.isascii()
+            or any(c in url for c in URLPARSE_FALLBACK_CHARS)):
+        try:
+            return urlparse(url).hostname or ''
+        except ValueError:
+            return ''
+    match = HOSTNAME_PATTERN.match(url)
+    return match.group(1).lower() if match else ''
+
+
+_cached_hostname = lru_cache(maxsize=HOSTNAME_CACHE_SIZE)(_parse_hostname)
+
+
 class ThreatIntelligence:
     """Real-time threat intelligence engine"""
     
     def __init__(self):
-        self.cache = {}
         self.cache_ttl = 3600  # 1 hour cache
-        self.custom_whitelist = set()
-        self.custom_blacklist = set()
+        self.failure_cache_ttl = 300  # results from failed WHOIS/SSL lookups, retried sooner
+        self.cache = TTLCache(maxsize=10000, ttl=self.cache_ttl)
+        self.failure_cache = TTLCache(maxsize=10000, ttl=self.failure_cache_ttl)
+        self.cache_lock = threading.Lock()
+        self.pending_lookups = {}  # cache_key -> Future for lookups in progress
+        # WHOIS and SSL lookups are network-bound and independent, so they run side by side.
+        # Sized for two lookups per domain on each of the 16 request threads the Procfile
+        # runs. Every socket inside a lookup times out before lookup_timeout, so a lookup
+        # the caller gave up on frees its worker about when the caller moves on.
+        self.lookup_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix='reputation-lookup')
+        self.lookup_timeout = 10  # seconds
+        self.whois_timeout = 4  # per WHOIS server; a referral queries two
+        self.ssl_timeout = 5
+        # Read without locking: writers swap in new frozensets under lists_lock
+        self.custom_whitelist = frozenset()
+        self.custom_blacklist = frozenset()
+        self.lists_lock = threading.Lock()
         
     def check_domain_reputation(self, domain: str) -> Dict:
         """
@@ -112,11 +241,33 @@ class ThreatIntelligence:
         Returns comprehensive threat assessment
         """
         cache_key = f"reputation:{domain}"
-        if cache_key in self.cache:
-            cached = self.cache[cache_key]
-            if time.time() - cached['timestamp'] < self.cache_ttl:
-                return cached['data']
+        with self.cache_lock:
+            cached = self.cache.get(cache_key) or self.failure_cache.get(cache_key)
+            if cached is None:
+                # Single flight: concurrent callers for the same domain wait on one lookup
+                pending = self.pending_lookups.get(cache_key)
+                is_owner = pending is None
+                if is_owner:
+                    pending = self.pending_lookups[cache_key] = Future()
+        if cached is not None:
+            return cached
+        if not is_owner:
+            return pending.result()
         
+        try:
+            result = self._assess_domain(domain, cache_key)
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        else:
+            pending.set_result(result)
+            return result
+        finally:
+            with self.cache_lock:
+                del self.pending_lookups[cache_key]
+    
+    def _assess_domain(self, domain: str, cache_key: str) -> Dict:
+        """Run the reputation checks for a domain and cache the result under cache_key"""
         result = {
             'domain': domain,
             'reputation_score': 100,  # Start with max score
@@ -140,17 +291,19 @@ class ThreatIntelligence:
             return result
         
         # Check against known phishing patterns
-        for pattern in KNOWN_PHISHING_PATTERNS:
-            if re.match(pattern, domain, re.IGNORECASE):
-                result['risk_factors'].append('Matches known phishing URL pattern')
-                result['reputation_score'] -= 40
-                result['threat_types'].append('phishing_pattern')
-                break
+        if KNOWN_PHISHING_PATTERN.match(domain):
+            result['risk_factors'].append('Matches known phishing URL pattern')
+            result['reputation_score'] -= 40
+            result['threat_types'].append('phishing_pattern')
         
         result['checks_performed'].append('pattern_matching')
         
+        # Start both network lookups before waiting on either
+        age_future = self.lookup_pool.submit(self._check_domain_age, domain)
+        ssl_future = self.lookup_pool.submit(self._check_ssl_certificate, domain)
+        
         # Check domain age if possible
-        age_result = self._check_domain_age(domain)
+        age_result, age_failed = self._lookup_result(age_future)
         if age_result:
             result['domain_age_days'] = age_result.get('age_days')
             if age_result.get('age_days', 365) < 30:
@@ -160,7 +313,7 @@ class ThreatIntelligence:
             result['checks_performed'].append('domain_age')
         
         # Check SSL certificate
-        ssl_result = self._check_ssl_certificate(domain)
+        ssl_result, ssl_failed = self._lookup_result(ssl_future)
         if ssl_result:
             result['ssl_info'] = ssl_result
             # Only penalize for actual verification failures, not connection errors
@@ -178,58 +331,74 @@ class ThreatIntelligence:
         if result['reputation_score'] < 40:
             result['is_malicious'] = True
         
-        # Cache result
-        self.cache[cache_key] = {
-            'data': result,
-            'timestamp': time.time()
-        }
+        # Cache result. If WHOIS or the SSL connection raised or timed out, keep it
+        # only briefly: a dead host isn't re-queried on every call, but is retried
+        # soon. A lookup that answered without data is a normal result.
+        with self.cache_lock:
+            if age_failed or ssl_failed:
+                self.failure_cache[cache_key] = result
+            else:
+                self.cache[cache_key] = result
         
         return result
     
-    def _check_domain_age(self, domain: str) -> Optional[Dict]:
-        """Check domain registration age via WHOIS"""
+    def _lookup_result(self, future) -> Tuple[Optional[Dict], bool]:
+        """Wait for a WHOIS/SSL lookup's (result, failed), treating one that overruns lookup_timeout as failed"""
+        try:
+            return future.result(timeout=self.lookup_timeout)
+        except FutureTimeoutError:
+            future.cancel()  # only helps if it is still queued
+            return None, True
+    
+    def _check_domain_age(self, domain: str) -> Tuple[Optional[Dict], bool]:
+        """Check domain registration age via WHOIS; returns (result, failed)"""
+        if whois is None:
+            return None, False
+        try:
+            w = whois.whois(domain, timeout=self.whois_timeout)
+        except Exception:
+            return None, True
         try:
-            import whois
-            w = whois.whois(domain)
             if w.creation_date:
                 creation = w.creation_date
                 if isinstance(creation, list):
                     creation = creation[0]
-                age_days = (datetime.now() - creation).days
+                # Epoch arithmetic; naive WHOIS dates are read as local time,
+                # as datetime.now() did
+                age_days = int((time.time() - creation.timestamp()) // 86400)
                 return {
                     'age_days': age_days,
                     'created': creation.isoformat() if creation else None,
                     'registrar': w.registrar
-                }
+                }, False
         except Exception:
             pass
-        return None
+        return None, False
     
-    def _check_ssl_certificate(self, domain: str) -> Optional[Dict]:
-        """Check SSL certificate validity and details"""
+    def _check_ssl_certificate(self, domain: str) -> Tuple[Optional[Dict], bool]:
+        """Check SSL certificate validity and details; returns (result, failed)"""
         try:
-            context = ssl.create_default_context()
-            with socket.create_connection((domain, 443), timeout=5) as sock:
-                with context.wrap_socket(sock, server_hostname=domain) as ssock:
+            with socket.create_connection((domain, 443), timeout=self.ssl_timeout) as sock:
+                with SSL_CONTEXT.wrap_socket(sock, server_hostname=domain) as ssock:
                     cert = ssock.getpeercert()
-                    not_after = datetime.strptime(cert['notAfter'], '%b %d %H:%M:%S %Y %Z')
-                    days_until_expiry = (not_after - datetime.now()).days
+                    not_after = ssl.cert_time_to_seconds(cert['notAfter'])  # epoch seconds, UTC
+                    days_until_expiry = int((not_after - time.time()) // 86400)
                     
                     return {
                         'valid': True,
                         'issuer': dict(x[0] for x in cert['issuer']),
                         'subject': dict(x[0] for x in cert['subject']),
-                        'expires': not_after.isoformat(),
+                        'expires': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(not_after)),
                         'days_until_expiry': days_until_expiry
-                    }
+                    }, False
         except ssl.SSLCertVerificationError as e:
             # Check if it's a system-level issue (missing root certs)
             if 'unable to get local issuer certificate' in str(e):
                 # This is a system config issue, not the domain's fault
-                return {'valid': None, 'error': 'System SSL config issue - skipped'}
-            return {'valid': False, 'error': 'Certificate verification failed'}
+                return {'valid': None, 'error': 'System SSL config issue - skipped'}, False
+            return {'valid': False, 'error': 'Certificate verification failed'}, False
         except Exception as e:
-            return {'valid': None, 'error': str(e)}
+            return {'valid': None, 'error': str(e)}, True
     
     def analyze_page_content(self, content: str) -> Dict:
         """
@@ -247,99 +416,104 @@ class ThreatIntelligence:
         
         content_lower = content.lower()
         
-        # Check for malicious script patterns
-        for threat_type, patterns in MALICIOUS_SCRIPT_PATTERNS.items():
-            for pattern in patterns:
-                if re.search(pattern, content_lower, re.IGNORECASE):
-                    result['threats_detected'].append({
-                        'type': threat_type,
-                        'pattern': pattern,
-                        'severity': 'high' if threat_type in ['keylogger', 'credential_stealer'] else 'medium'
-                    })
-                    result['risk_score'] += 30
+        # Check for malicious script patterns (first match per group)
+        hits = 0
+        for threat_type, patterns in COMPILED_SCRIPT_PATTERNS.items():
+            literals = SCRIPT_PATTERN_LITERALS.get(threat_type)
+            if literals and not any(literal in content_lower for literal in literals):
+                continue
+            for bit, pattern in patterns:
+                if pattern.search(content_lower):
+                    hits |= bit
                     break
         
         # Check for data exfiltration patterns
-        for pattern in EXFILTRATION_PATTERNS:
-            if re.search(pattern, content_lower, re.IGNORECASE):
-                result['threats_detected'].append({
-                    'type': 'data_exfiltration',
-                    'pattern': pattern,
-                    'severity': 'critical'
-                })
-                result['risk_score'] += 40
-                break
+        if any(literal in content_lower for literal in EXFILTRATION_LITERALS):
+            for bit, pattern in COMPILED_EXFILTRATION_PATTERNS:
+                if pattern.search(content_lower):
+                    hits |= bit
+                    break
         
         # Check for suspicious form actions
-        for pattern in SUSPICIOUS_FORM_PATTERNS:
-            if re.search(pattern, content_lower, re.IGNORECASE):
-                result['threats_detected'].append({
-                    'type': 'suspicious_form',
-                    'pattern': pattern,
-                    'severity': 'high'
-                })
-                result['risk_score'] += 35
-                break
+        if any(literal in content_lower for literal in FORM_LITERALS):
+            for bit, pattern in COMPILED_FORM_PATTERNS:
+                if pattern.search(content_lower):
+                    hits |= bit
+                    break
         
-        # Check for hidden credential fields
-        hidden_password = re.search(
-            r'<input[^>]*type=["\']hidden["\'][^>]*name=["\'].*(?:pass|pwd|password)',
-            content_lower
+        # Check for hidden credential fields (the regex only runs if its literals are present)
+        hidden_password = (
+            'hidden' in content_lower
+            and ('pass' in content_lower or 'pwd' in content_lower)
+            and HIDDEN_CREDENTIAL_PATTERN.search(content_lower)
         )
         if hidden_password:
-            result['threats_detected'].append({
-                'type': 'hidden_credential_field',
-                'severity': 'critical'
-            })
-            result['risk_score'] += 50
+            hits |= HIDDEN_CREDENTIAL_BIT
         
         # Check for fake login forms
-        if self._detect_fake_login_form(content):
-            result['threats_detected'].append({
-                'type': 'fake_login_form',
-                'severity': 'high'
-            })
-            result['risk_score'] += 35
+        if self._detect_fake_login_form(content_lower):
+            hits |= FAKE_LOGIN_BIT
+        
+        # Build the report from the table rows, lowest bit first
+        threats = result['threats_detected']
+        score = 0
+        while hits:
+            bit = hits & -hits
+            hits ^= bit
+            row = bit.bit_length() - 1
+            threats.append(dict(CONTENT_THREAT_ENTRIES[row]))
+            score += CONTENT_THREAT_SCORES[row]
         
         # Normalize score
-        result['risk_score'] = min(100, result['risk_score'])
-        result['is_malicious'] = result['risk_score'] >= 50 or len(result['threats_detected']) >= 2
+        result['risk_score'] = min(100, score)
+        result['is_malicious'] = result['risk_score'] >= 50 or len(threats) >= 2
         
         return result
     
-    def _detect_fake_login_form(self, content: str) -> bool:
-        """Detect characteristics of fake login forms"""
+    def _detect_fake_login_form(self, content_lower: str) -> bool:
+        """Detect characteristics of fake login forms (two or more indicators) in lowercased content"""
         indicators = 0
-        content_lower = content.lower()
         
-        # Multiple brand mentions in one page
-        brands = ['google', 'facebook', 'apple', 'microsoft', 'amazon', 'paypal', 'netflix']
-        brand_count = sum(1 for brand in brands if brand in content_lower)
-        if brand_count >= 2:
-            indicators += 1
+        # Cheap substring checks first; the regexes below only run if they can still matter
         
-        # Password field without proper autocomplete
-        if re.search(r'<input[^>]*type=["\']password["\'][^>]*(?!autocomplete)', content_lower):
-            indicators += 1
+        # Multiple brand mentions in one page (stop counting at two)
+        brand_count = 0
+        for brand in FAKE_LOGIN_BRANDS:
+            if brand in content_lower:
+                brand_count += 1
+                if brand_count >= 2:
+                    indicators += 1
+                    break
         
-        # Form without action or with javascript action
-        if re.search(r'<form[^>]*action=["\']javascript:', content_lower):
+        # Urgent language
+        if any(phrase in content_lower for phrase in URGENT_PHRASES):
             indicators += 1
         
-        # Urgent language
-        urgent_phrases = ['urgent', 'immediate', 'suspended', 'verify now', 'act now', 'limited time']
-        if any(phrase in content_lower for phrase in urgent_phrases):
+        if indicators >= 2:
+            return True
+        
+        # Password field
+        if 'password' in content_lower and PASSWORD_FIELD_PATTERN.search(content_lower):
             indicators += 1
         
-        return indicators >= 2
+        # One check left: it can only tip the result if we already have an indicator
+        if indicators == 0:
+            return False
+        if indicators >= 2:
+            return True
+        
+        # Form without action or with javascript action
+        return 'javascript:' in content_lower and bool(JAVASCRIPT_FORM_ACTION_PATTERN.search(content_lower))
     
     def check_url_safety(self, url: str) -> Dict:
         """
         Comprehensive URL safety check
         """
         try:
-            parsed = urlparse(url)
-            domain = parsed.netloc.lower()
+            if isinstance(url, str):
+                domain = extract_hostname(url)
+            else:
+                domain = urlparse(url).hostname or ''
             
             # Get domain reputation
             reputation = self.check_domain_reputation(domain)
@@ -367,28 +541,38 @@ class ThreatIntelligence:
                 'recommendation': 'caution'
             }
     
+    def _forget_domain(self, domain: str):
+        """Drop cached reputation results for a domain"""
+        cache_key = f"reputation:{domain}"
+        with self.cache_lock:
+            self.cache.pop(cache_key, None)
+            self.failure_cache.pop(cache_key, None)
+    
     def add_to_whitelist(self, domain: str):
         """Add domain to custom whitelist"""
-        self.custom_whitelist.add(domain.lower())
-        self.custom_blacklist.discard(domain.lower())
+        domain = domain.lower()
+        with self.lists_lock:
+            self.custom_whitelist = self.custom_whitelist | {domain}
+            self.custom_blacklist = self.custom_blacklist - {domain}
         # Clear cache for this domain
-        cache_key = f"reputation:{domain.lower()}"
-        self.cache.pop(cache_key, None)
+        self._forget_domain(domain)
     
     def add_to_blacklist(self, domain: str):
         """Add domain to custom blacklist"""
-        self.custom_blacklist.add(domain.lower())
-        self.custom_whitelist.discard(domain.lower())
+        domain = domain.lower()
+        with self.lists_lock:
+            self.custom_blacklist = self.custom_blacklist | {domain}
+            self.custom_whitelist = self.custom_whitelist - {domain}
         # Clear cache for this domain
-        cache_key = f"reputation:{domain.lower()}"
-        self.cache.pop(cache_key, None)
+        self._forget_domain(domain)
     
     def remove_from_lists(self, domain: str):
         """Remove domain from both lists"""
-        self.custom_whitelist.discard(domain.lower())
-        self.custom_blacklist.discard(domain.lower())
-        cache_key = f"reputation:{domain.lower()}"
-        self.cache.pop(cache_key, None)
+        domain = domain.lower()
+        with self.lists_lock:
+            self.custom_whitelist = self.custom_whitelist - {domain}
+            self.custom_blacklist = self.custom_blacklist - {domain}
+        self._forget_domain(domain)
     
     def get_lists(self) -> Dict:
         """Get current whitelist and blacklist"""